@@ -14,9 +14,12 @@ import getopt
 from typing import Sequence, Set, Callable
 
 from . import merge_criteria as mc
+from .interval_index import IntervalIndex
+from . import columnar
+from .columnar import ColumnarFeatures
 
 usage = """
-Usage: feature_merge [-i] [-e] [-s] [-x] [-v] [-t <number>]  [-m merge|append|error|skip|replace] [-f type[,type..]].. <input1> [<input_n>..]
+Usage: feature_merge [-i] [-e] [-s] [-x] [-v] [-c] [-t <number>]  [-m merge|append|error|skip|replace] [-f type[,type..]].. <input1> [<input_n>..]
 Accepts GFF or GTF format.
 -v Print version and exit
 -f Comma seperated types of features to merge. Must be terms or accessions from the SOFA sequence ontology, \"ALL\", or \"NONE\". (Can be provided more than once to specify multiple merge groups)
@@ -25,6 +28,7 @@ Accepts GFF or GTF format.
 -x Only merge features with identical coordinates
 -t Threshold distance between features to merge 
 -e Exclude component features from output
+-c Cache parsed input in a columnar sidecar next to each input file and reuse it on later runs
 -m Merge strategy used to deal with id collisions between input files.
     merge: attributes of all features with the same primary key will be merged
     append: entry will have a unique, autoincremented primary key assigned to it (default)
@@ -281,6 +285,7 @@ def get_args(sysargs):
     exclude_components = False
     featuretypes_groups = []
     merge_strategy = "create_unique"
+    sidecar = False
     merge_criteria = []
     merge_order = []
     # Parse arguments
@@ -309,6 +314,8 @@ def get_args(sysargs):
                 threshold = int(val)
             elif opt == '-s':
                 ignore_seqid = True
+            elif opt == '-c':
+                sidecar = True
 
     except getopt.GetoptError as err:
         # TODO raise exception rather than exit
@@ -350,15 +357,22 @@ def get_args(sysargs):
     if ignore_featuretypes:
         merge_order.append('featuretype')
 
-    return paths, merge_strategy, tuple(merge_order), merge_criteria, featuretypes_groups, exclude_components
+    return paths, merge_strategy, tuple(merge_order), merge_criteria, featuretypes_groups, exclude_components, sidecar
 
 
-def load_data(paths: [str], merge_strategy: str = "create_unique") -> gffutils.FeatureDB:
+def load_data(paths: [str], merge_strategy: str = "create_unique", sidecar: bool = False) -> gffutils.FeatureDB:
     paths = list(filter(lambda f: os.path.getsize(f), paths))
     db = None
     while len(paths):
         try:
-            db = gffutils.create_db(paths[0], ":memory:", merge_strategy=merge_strategy)
+            if sidecar:
+                data = columnar.load_sidecar(paths[0])
+                try:
+                    db = gffutils.create_db(iter(data), ":memory:", dialect=data.dialect, merge_strategy=merge_strategy)
+                finally:
+                    if isinstance(data, ColumnarFeatures): data.close()
+            else:
+                db = gffutils.create_db(paths[0], ":memory:", merge_strategy=merge_strategy)
             break
         except ValueError as e:
             print("Error while parsing ", paths[0], e, file=sys.stderr)
@@ -366,7 +380,14 @@ def load_data(paths: [str], merge_strategy: str = "create_unique") -> gffutils.F
 
     for path in paths[1:]:
         try:
-            update(db, path, merge_strategy=merge_strategy)
+            if sidecar:
+                data = columnar.load_sidecar(path)
+                try:
+                    update(db, iter(data), merge_strategy=merge_strategy)
+                finally:
+                    if isinstance(data, ColumnarFeatures): data.close()
+            else:
+                update(db, path, merge_strategy=merge_strategy)
         except ValueError as e:
             print("Error while parsing ", path, e, file=sys.stderr)
 
@@ -4,10 +4,10 @@ import sys
 from . import get_args, load_data, merge_all, update
 
 def main():
-    paths, merge_strategy, merge_order, *args = get_args(sys.argv[1:])
+    paths, merge_strategy, merge_order, *args, sidecar = get_args(sys.argv[1:])
 
     try:
-        db = load_data(paths, merge_strategy)
+        db = load_data(paths, merge_strategy, sidecar)
     except ValueError as e:
         # Catch empty data, exit normally
         print(e, file=sys.stderr)
@@ -0,0 +1,353 @@
+"""
+Compact columnar binary sidecar for parsed features.
+Coordinates are stored as fixed width arrays, seqid/source/featuretype/strand/frame are dictionary encoded, and
+the id, score, attributes and extra fields of each feature are stored as offset indexed JSON blobs.
+Files are loaded with mmap, columns are views over the mapped file and Feature instances are only built on access.
+
+ColumnarFeatures can be passed to merge() and IntervalIndex in place of a FeatureDB. merge_all() modifies the
+database, so the command line (-c) loads the sidecar into an in-memory FeatureDB. That skips parsing the text but
+still pays for building the database.
+
+Layout (native byte order, every section aligned to 8 bytes):
+    header: magic, feature count, length of the dictionary section
+    dictionaries: JSON object holding the dialect, byte order, size and mtime of the source file and the values of
+        each encoded column
+    start, end: int64 per feature
+    seqid, source, featuretype, strand, frame: uint32 code per feature
+    record offsets: uint64 per feature + 1
+    records: concatenated JSON [id, score, attributes, extra] per feature
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Iterable, Sequence, Set, Union
+
+from gffutils import Feature
+from gffutils.iterators import DataIterator
+
+magic = b'FMCOL\x00\x00\x02'
+extension = '.fmcol'
+
+_header = struct.Struct('=8sQQ')
+_encoded = ('seqid', 'source', 'featuretype', 'strand', 'frame')
+_recorded = ('id', 'score')
+_sortable = ('start', 'end') + _recorded + _encoded
+_chunk = 1 << 16  # Features buffered per column before spooling to disk
+
+
+def _pad(length: int) -> int:
+    return -length % 8
+
+
+def sidecar_path(path: str) -> str:
+    """
+    :param path: path to GFF or GTF file
+    :return: path of the sidecar written next to it
+    """
+    return path + extension
+
+
+def _write_section(file, source):
+    """
+    Copy a spooled section to file followed by its padding
+    :param file: destination file
+    :param source: spooled file positioned at its end
+    """
+    size = source.tell()
+    source.seek(0)
+    shutil.copyfileobj(source, file)
+    file.write(b'\0' * _pad(size))
+
+
+def _source_stat(path: str) -> dict:
+    """
+    :param path: path to GFF or GTF file
+    :return: size and mtime of path, used to tell if a sidecar is current
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def dump(features: 'Iterable[Feature]', path: str, dialect: dict = None, source: str = None):
+    """
+    Write features to a columnar sidecar
+    Columns and records are spooled to temporary files as features are read so memory use does not grow with the
+    input, then assembled in a temporary file that replaces path once complete.
+    :param features: Iterable of Feature instances
+    :param path: destination path
+    :param dialect: gffutils dialect of the features, defaults to that of the first feature
+    :param source: path of the file the features were parsed from, recorded to detect when it changes
+    """
+    source = _source_stat(source) if source else None
+    codes = {column: {} for column in _encoded}
+    buffers = {column: array('I') for column in _encoded}
+    buffers['start'] = array('q')
+    buffers['end'] = array('q')
+    buffers['offsets'] = array('Q', [0])
+    spools = {name: tempfile.TemporaryFile() for name in buffers}
+    records = tempfile.TemporaryFile()
+    count = 0
+    records_len = 0
+
+    def flush():
+        for name, buffer in buffers.items():
+            buffer.tofile(spools[name])
+            del buffer[:]
+
+    try:
+        for feature in features:
+            if dialect is None:
+                dialect = feature.dialect
+            buffers['start'].append(-1 if feature.start is None else feature.start)
+            buffers['end'].append(-1 if feature.end is None else feature.end)
+            for column in _encoded:
+                values = codes[column]
+                buffers[column].append(values.setdefault(getattr(feature, column), len(values)))
+            record = json.dumps([feature.id, feature.score, dict(feature.attributes), feature.extra], separators=(',', ':')).encode()
+            records.write(record)
+            records_len += len(record)
+            buffers['offsets'].append(records_len)
+            count += 1
+            if count % _chunk == 0:
+                flush()
+        flush()
+
+        dictionaries = json.dumps({
+            'dialect': dialect,
+            'byteorder': sys.byteorder,
+            'source': source,
+            'values': {column: list(values) for column, values in codes.items()},
+        }).encode()
+
+        file = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                           prefix=os.path.basename(path), suffix='.tmp', delete=False)
+        try:
+            with file:
+                file.write(_header.pack(magic, count, len(dictionaries)))
+                file.write(dictionaries)
+                file.write(b'\0' * _pad(len(dictionaries)))
+                for name in ('start', 'end', *_encoded, 'offsets'):
+                    _write_section(file, spools[name])
+                _write_section(file, records)
+            os.replace(file.name, path)
+        except BaseException:
+            os.unlink(file.name)
+            raise
+    finally:
+        for spool in (*spools.values(), records):
+            spool.close()
+
+
+class ColumnarFeatures:
+    """
+    Memory mapped columnar sidecar.
+    Implements the parts of the FeatureDB interface used by merge() and IntervalIndex so that it can be passed in place
+    of a FeatureDB. Column values are exposed as memoryviews (start, end) or codes into a dictionary
+    (seqid, source, featuretype, strand, frame, see values()).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            if len(self._mmap) < _header.size:
+                raise ValueError("Truncated columnar file: " + path)
+            file_magic, count, dictionaries_len = _header.unpack_from(self._mmap)
+            if file_magic != magic:
+                raise ValueError("Not a feature_merge columnar file: " + path)
+            offset = _header.size
+            if len(self._mmap) < offset + dictionaries_len:
+                raise ValueError("Truncated columnar file: " + path)
+            dictionaries = json.loads(bytes(self._view[offset:offset + dictionaries_len]))
+            if not isinstance(dictionaries, dict) \
+                    or not all(name in dictionaries for name in ('dialect', 'byteorder', 'source', 'values')) \
+                    or not all(column in dictionaries['values'] for column in _encoded):
+                raise ValueError("Invalid columnar file: " + path)
+            if dictionaries['byteorder'] != sys.byteorder:
+                raise ValueError("Columnar file was written with a different byte order: " + path)
+            self._values = dictionaries['values']
+            self.dialect = dictionaries['dialect']
+            self.source = dictionaries['source']
+            offset += dictionaries_len + _pad(dictionaries_len)
+
+            def column(typecode: str, length: int):
+                nonlocal offset
+                size = length * array(typecode).itemsize
+                if len(self._mmap) < offset + size:
+                    raise ValueError("Truncated columnar file: " + path)
+                view = self._view[offset:offset + size].cast(typecode)
+                offset += size + _pad(size)
+                return view
+
+            self.start = column('q', count)
+            self.end = column('q', count)
+            self._codes = {name: column('I', count) for name in _encoded}
+            self._offsets = column('Q', count + 1)
+            if len(self._mmap) < offset + self._offsets[count]:
+                raise ValueError("Truncated columnar file: " + path)
+            self._records = self._view[offset:offset + self._offsets[count]]
+        except Exception:
+            self.close()
+            raise
+
+        self.keep_order = False
+        self.sort_attribute_values = False
+        self._autoincrements = {}
+
+    def codes(self, column: str) -> memoryview:
+        """
+        :param column: one of seqid, source, featuretype, strand, frame
+        :return: dictionary code of each feature for column
+        """
+        return self._codes[column]
+
+    def values(self, column: str) -> [str]:
+        """
+        :param column: one of seqid, source, featuretype, strand, frame
+        :return: dictionary of column, indexed by code
+        """
+        return self._values[column]
+
+    def _feature_returner(self, **kwargs):
+        kwargs.setdefault("dialect", self.dialect)
+        kwargs.setdefault("keep_order", self.keep_order)
+        kwargs.setdefault("sort_attribute_values", self.sort_attribute_values)
+        return Feature(**kwargs)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, i: int) -> Feature:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        feature_id, score, attributes, extra = self._record(i)
+        start, end = self.start[i], self.end[i]
+        return self._feature_returner(
+            id=feature_id, score=score, attributes=attributes, extra=extra,
+            start=None if start == -1 else start, end=None if end == -1 else end,
+            **{column: self._values[column][self._codes[column][i]] for column in _encoded})
+
+    def _record(self, i: int) -> list:
+        return json.loads(bytes(self._records[self._offsets[i]:self._offsets[i + 1]]))
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def count_features_of_type(self, featuretype: str = None) -> int:
+        return len(self._select(featuretype))
+
+    def _select(self, featuretype: 'Union[str, Set[str]]' = None) -> 'Sequence[int]':
+        if featuretype is None:
+            return range(len(self))
+        if isinstance(featuretype, str):
+            featuretype = (featuretype,)
+        values = self._values['featuretype']
+        wanted = set(i for i, value in enumerate(values) if value in featuretype)
+        codes = self._codes['featuretype']
+        return [i for i in range(len(self)) if codes[i] in wanted]
+
+    def all_features(self, featuretype: 'Union[str, Set[str]]' = None, order_by: (str,) = None,
+                     reverse: bool = False) -> 'Iterable[Feature]':
+        """
+        Iterate features, see FeatureDB.all_features()
+        Features are emitted in the order they were dumped unless order_by is given. Sorting is a stable sort of the
+        row numbers per column, run in Python, so for large inputs dump the features already in the order needed.
+        Sorting by id or score decodes the record of every row.
+        :param featuretype: featuretype or collection of featuretypes to emit, None for all
+        :param order_by: Ordered list of columns to sort by, any of start, end, id, seqid, source, featuretype, score,
+            strand, frame
+        :param reverse: True to sort the last column of order_by in descending order, as FeatureDB does
+        :return: generator emitting Feature instances
+        """
+        rows = self._select(featuretype)
+        if order_by:
+            if isinstance(order_by, str):
+                order_by = (order_by,)
+            for column in order_by:
+                if column not in _sortable:
+                    raise ValueError("Can not order by {}, expected any of {}".format(column, ', '.join(_sortable)))
+            rows = list(rows)
+            # Sort by the least significant column first, each sort is stable
+            for position, column in reversed(list(enumerate(order_by))):
+                descending = reverse and position == len(order_by) - 1
+                if column in ('start', 'end'):
+                    rows.sort(key=getattr(self, column).__getitem__, reverse=descending)
+                elif column in _recorded:
+                    field = _recorded.index(column)
+                    rows.sort(key=lambda i: self._record(i)[field] or '', reverse=descending)
+                else:
+                    # Rank codes by their value so rows sort as the text would
+                    values = self._values[column]
+                    ranks = array('Q', [0]) * len(values)
+                    for rank, code in enumerate(sorted(range(len(values)), key=values.__getitem__)):
+                        ranks[code] = rank
+                    codes = self._codes[column]
+                    rows.sort(key=lambda i: ranks[codes[i]], reverse=descending)
+        elif reverse:
+            rows = reversed(rows)
+        return map(self.__getitem__, rows)
+
+    def close(self):
+        """
+        Release the mapped file. Columns obtained from this instance become invalid.
+        If views derived from the columns are still held, the file stays mapped until they are garbage collected.
+        """
+        for view in (*getattr(self, '_codes', {}).values(), getattr(self, 'start', None), getattr(self, 'end', None),
+                     getattr(self, '_offsets', None), getattr(self, '_records', None), self._view):
+            if view is not None:
+                view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Derived views still export the buffer, the mmap closes when it is collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load(path: str) -> ColumnarFeatures:
+    """
+    Memory map a columnar sidecar
+    :param path: path to sidecar
+    :return: ColumnarFeatures instance
+    """
+    return ColumnarFeatures(path)
+
+
+def load_sidecar(path: str) -> 'Union[ColumnarFeatures, DataIterator]':
+    """
+    Load the sidecar next to a GFF or GTF file, parsing the file and writing the sidecar if it is missing, was written
+    from a different version of the file or can not be loaded.
+    If the sidecar can not be written the parsed file is returned instead.
+    :param path: path to GFF or GTF file
+    :return: ColumnarFeatures instance, or DataIterator over path if the sidecar could not be written
+    """
+    sidecar = sidecar_path(path)
+    if os.path.exists(sidecar):
+        try:
+            features = load(sidecar)
+            if features.source == _source_stat(path):
+                return features
+            features.close()
+        except (ValueError, OSError) as e:
+            print("Rebuilding columnar sidecar ", sidecar, e, file=sys.stderr)
+
+    data = DataIterator(path)
+    try:
+        dump(data, sidecar, data.dialect, path)
+    except OSError as e:
+        print("Unable to write columnar sidecar ", sidecar, e, file=sys.stderr)
+        return DataIterator(path)
+    return load(sidecar)
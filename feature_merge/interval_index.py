@@ -0,0 +1,286 @@
+"""
+In-memory interval index over features.
+Features are partitioned (by default on seqid and strand) and each partition is stored as an implicit augmented
+interval tree: an array of features sorted by start where every node records the maximum end of its subtree.
+This allows overlap queries and merging that does not depend on the order the features were loaded in.
+"""
+from gffutils import Feature, FeatureDB
+from bisect import bisect_right
+from copy import deepcopy
+from typing import Callable, Iterable, Hashable, List, Dict
+
+
+def _always(acc: Feature, cur: Feature, components: [Feature]):
+    return True
+
+
+class _Partition:
+    """
+    Implicit augmented interval tree. Node i is at level k where k is the number of trailing 1 bits of i.
+    Coordinates are 1-based and closed, as in GFF.
+    """
+    __slots__ = ('features', 'starts', 'ends', 'max_ends', 'prefix_max_ends', 'max_level')
+
+    def __init__(self, features: [Feature]):
+        self.features = sorted(features, key=lambda f: (f.start, f.end))
+        self.starts = [f.start for f in self.features]
+        self.ends = [f.end for f in self.features]
+        self.max_ends = list(self.ends)
+        self.prefix_max_ends = []
+        max_end = None
+        for end in self.ends:
+            max_end = end if max_end is None or end > max_end else max_end
+            self.prefix_max_ends.append(max_end)
+        self.max_level = self._index()
+
+    def boundary(self, i: int, threshold: int) -> bool:
+        """
+        Features sorted by start form contiguous components, a new one begins at i if no earlier feature reaches it.
+        :param i: index into self.features
+        :param threshold: Threshold distance between features to merge
+        :return: True if i is the first feature of a component
+        """
+        return i == 0 or self.starts[i] > self.prefix_max_ends[i - 1] + threshold
+
+    def _index(self) -> int:
+        n = len(self.features)
+        if n == 0:
+            return -1
+        max_ends = self.max_ends
+        last_i = n - 1 if (n - 1) % 2 == 0 else n - 2
+        last = max_ends[last_i]
+        k = 1
+        while 1 << k <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                left = max_ends[i - x]
+                right = max_ends[i + x] if i + x < n else last
+                max_ends[i] = max(max_ends[i], left, right)
+            last_i = last_i - x if last_i >> k & 1 else last_i + x
+            if last_i < n and max_ends[last_i] > last:
+                last = max_ends[last_i]
+            k += 1
+        return k - 1
+
+    def overlapping(self, start: int, end: int) -> [int]:
+        """
+        :param start: first position of query
+        :param end: last position of query
+        :return: indices into self.features of all features overlapping [start, end]
+        """
+        result = []
+        if self.max_level < 0:
+            return result
+        n = len(self.features)
+        starts, ends, max_ends = self.starts, self.ends, self.max_ends
+        stack = [(self.max_level, (1 << self.max_level) - 1, False)]
+        while stack:
+            k, x, left_done = stack.pop()
+            if k <= 3:
+                # Small subtree, scan linearly
+                i0 = x >> k << k
+                i1 = min(i0 + (1 << (k + 1)) - 1, n)
+                for i in range(i0, i1):
+                    if starts[i] > end:
+                        break
+                    if ends[i] >= start:
+                        result.append(i)
+            elif not left_done:
+                stack.append((k, x, True))
+                y = x - (1 << (k - 1))
+                # Descend left if the child is out of range or its subtree may reach the query
+                if y >= n or max_ends[y] >= start:
+                    stack.append((k - 1, y, False))
+            elif x < n and starts[x] <= end:
+                if ends[x] >= start:
+                    result.append(x)
+                stack.append((k - 1, x + (1 << (k - 1)), False))
+        return result
+
+
+class IntervalIndex:
+    """
+    Index of features supporting overlap queries and order independent merging.
+    Built once from a FeatureDB (or any iterable of features) and partitioned on the feature properties listed in
+    partition_by. Query methods take the partition key as a tuple of those property values.
+
+    Merge criteria follow the callback interface described in merge(). Criteria are only evaluated between
+    features that are within threshold of each other, and a pair is linked if the criteria hold in either order.
+    """
+
+    def __init__(self, db: FeatureDB, features: 'Iterable[Feature]' = None,
+                 partition_by: (str,) = ('seqid', 'strand')):
+        """
+        :param db: FeatureDB used to assign IDs to merged features
+        :param features: Iterable of Feature instances to index, defaults to all features in db
+        :param partition_by: Feature properties that features must share to be compared
+        """
+        self.db = db
+        self.partition_by = tuple(partition_by)
+        if features is None:
+            features = db.all_features()
+
+        grouped = {}  # type: Dict[Hashable, List[Feature]]
+        for feature in features:
+            grouped.setdefault(self.key(feature), []).append(feature)
+
+        self._partitions = {key: _Partition(group) for key, group in grouped.items()}
+
+    def key(self, feature: Feature) -> tuple:
+        """
+        :param feature: Feature instance
+        :return: partition key of feature
+        """
+        return tuple(getattr(feature, prop) for prop in self.partition_by)
+
+    def partitions(self) -> [tuple]:
+        """
+        :return: list of partition keys present in the index
+        """
+        return list(self._partitions)
+
+    def __len__(self):
+        return sum(len(partition.features) for partition in self._partitions.values())
+
+    def overlapping(self, key: tuple, start: int, end: int) -> [Feature]:
+        """
+        Find all features overlapping a region
+        :param key: partition key, see partition_by
+        :param start: first position of region
+        :param end: last position of region
+        :return: list of features sorted by start
+        """
+        partition = self._partitions.get(tuple(key))
+        if partition is None:
+            return []
+        return [partition.features[i] for i in sorted(partition.overlapping(start, end))]
+
+    def within(self, key: tuple, start: int, end: int, distance: int) -> [Feature]:
+        """
+        Find all features within distance of a region
+        :param key: partition key, see partition_by
+        :param start: first position of region
+        :param end: last position of region
+        :param distance: maximum number of positions between a feature and the region
+        :return: list of features sorted by start
+        """
+        return self.overlapping(key, start - distance, end + distance)
+
+    @staticmethod
+    def _linked(a: Feature, b: Feature, criteria: [Callable]) -> bool:
+        return all(c(a, b, [a]) for c in criteria) or all(c(b, a, [b]) for c in criteria)
+
+    def components(self, threshold: int = 1, criteria: [Callable] = (_always,)) -> 'Iterable[List[Feature]]':
+        """
+        Group features into connected components.
+        Two features are connected if they are separated by less than threshold positions and satisfy criteria.
+        The default threshold of 1 joins overlapping and adjacent features, as mc.overlap_any_inclusive does.
+        Without criteria this is a single sweep over each partition. Custom criteria are evaluated once for each pair
+        of candidate features that are not already connected, dense partitions still visit every pair within reach.
+        :param threshold: Threshold distance between features to merge
+        :param criteria: List of merge criteria callbacks. See merge().
+        :return: generator emitting lists of features sorted by start
+        """
+        criteria = [c for c in criteria if c is not _always]
+        for partition in self._partitions.values():
+            features = partition.features
+            if not criteria:
+                component = []
+                for i, feature in enumerate(features):
+                    if component and partition.boundary(i, threshold):
+                        yield component
+                        component = []
+                    component.append(feature)
+                if component:
+                    yield component
+                continue
+
+            parents = list(range(len(features)))
+
+            def find(i):
+                while parents[i] != i:
+                    parents[i] = parents[parents[i]]
+                    i = parents[i]
+                return i
+
+            for i, feature in enumerate(features):
+                # Later features start after feature, so those in reach are a contiguous run
+                for j in range(i + 1, bisect_right(partition.starts, feature.end + threshold)):
+                    a, b = find(i), find(j)
+                    if a != b and self._linked(feature, features[j], criteria):
+                        parents[max(a, b)] = min(a, b)
+
+            components = {}
+            for i, feature in enumerate(features):
+                components.setdefault(find(i), []).append(feature)
+            yield from components.values()
+
+    def merge(self, threshold: int = 1, criteria: [Callable] = (_always,)) -> 'Iterable[Feature]':
+        """
+        Merge connected components of features. See components().
+        Emits features the same way merge() does, the result does not depend on the order features were loaded in.
+        :param threshold: Threshold distance between features to merge
+        :param criteria: List of merge criteria callbacks. See merge().
+        :return: generator emitting merged Feature instances
+        """
+        for component in self.components(threshold, criteria):
+            yield self._merge_component(component)
+
+    def cluster_at(self, key: tuple, position: int, threshold: int = 1,
+                   criteria: [Callable] = (_always,)) -> [Feature]:
+        """
+        Find the connected component containing a position without visiting the rest of the index.
+        With custom criteria several components may cover position, the one holding the covering feature with the
+        lowest start is returned.
+        :param key: partition key, see partition_by
+        :param position: position within the component
+        :param threshold: Threshold distance between features to merge
+        :param criteria: List of merge criteria callbacks. See merge().
+        :return: list of features sorted by start, empty if no feature contains position
+        """
+        partition = self._partitions.get(tuple(key))
+        if partition is None:
+            return []
+        pending = partition.overlapping(position, position)
+        if not pending:
+            return []
+        criteria = [c for c in criteria if c is not _always]
+
+        if not criteria:
+            # Components are contiguous runs of the start sorted features, walk out to their boundaries
+            first = last = min(pending)
+            while not partition.boundary(first, threshold):
+                first -= 1
+            while last + 1 < len(partition.features) and not partition.boundary(last + 1, threshold):
+                last += 1
+            return partition.features[first:last + 1]
+
+        pending = [min(pending)]
+        seen = set(pending)
+        while pending:
+            i = pending.pop()
+            feature = partition.features[i]
+            for j in partition.overlapping(feature.start - threshold, feature.end + threshold):
+                if j not in seen and self._linked(feature, partition.features[j], criteria):
+                    seen.add(j)
+                    pending.append(j)
+        return [partition.features[i] for i in sorted(seen)]
+
+    def merged_at(self, key: tuple, position: int, threshold: int = 1,
+                  criteria: [Callable] = (_always,)) -> 'Feature':
+        """
+        Merge the connected component containing a position. See cluster_at().
+        :return: merged Feature instance, or None if no feature contains position
+        """
+        cluster = self.cluster_at(key, position, threshold, criteria)
+        if not cluster:
+            return None
+        return self._merge_component(cluster)
+
+    def _merge_component(self, component: [Feature]) -> Feature:
+        from . import merge
+        if len(component) == 1:
+            # merge() emits a lone feature itself, copy it so the indexed feature is not modified
+            component = [deepcopy(component[0])]
+        # Every feature of a component is already known to belong, merge them unconditionally
+        return next(merge(self.db, component, merge_criteria=[_always]))
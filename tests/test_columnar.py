@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import gffutils
+
+from feature_merge import merge, columnar, IntervalIndex, load_data, merge_all
+from . import TestWithSynthDB, synthetic_path, num_synthetic_features, num_synthetic_overlap
+
+
+class TestColumnar(TestWithSynthDB):
+    def setUp(self) -> None:
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'synthetic.fmcol')
+        columnar.dump(self.db.all_features(), self.path, self.db.dialect)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        with columnar.load(self.path) as features:
+            self.assertEqual(num_synthetic_features, len(features))
+            for feature in features:
+                self.assertEqual(str(self.db[feature.id]), str(feature))
+            self.assertEqual(str(features[-1]), str(features[len(features) - 1]))
+            self.assertEqual(1, features.count_features_of_type('misc_feature'))
+            self.assertEqual(1, features.count_features_of_type({'misc_feature', 'not_present'}))
+
+    def test_order_by(self):
+        order = ('seqid', 'featuretype', 'strand', 'start')
+        with columnar.load(self.path) as features:
+            self.assertEqual([(f.seqid, f.featuretype, f.strand, f.start) for f in self.db.all_features(order_by=order)],
+                             [(f.seqid, f.featuretype, f.strand, f.start) for f in features.all_features(order_by=order)])
+
+    def test_merge(self):
+        with columnar.load(self.path) as features:
+            merged = list(merge(features, features.all_features(order_by=('seqid', 'featuretype', 'strand', 'start'))))
+            self.assertEqual(6, len(merged))
+            self.assertEqual([num_synthetic_overlap], [len(f.children) for f in merged if f.children])
+
+            index = IntervalIndex(features, partition_by=('seqid', 'featuretype', 'strand'))
+            self.assertEqual(num_synthetic_overlap, len(index.cluster_at(('seq1', 'sequence_feature', '.'), 1)))
+
+    def test_order_by_id(self):
+        with columnar.load(self.path) as features:
+            self.assertEqual(sorted(f.id for f in self.db.all_features()),
+                             [f.id for f in features.all_features(order_by=('id',))])
+            with self.assertRaises(ValueError):
+                list(features.all_features(order_by=('bin',)))
+
+    def test_reverse(self):
+        order = ('seqid', 'start')
+        with columnar.load(self.path) as features:
+            self.assertEqual([(f.seqid, f.start) for f in self.db.all_features(order_by=order, reverse=True)],
+                             [(f.seqid, f.start) for f in features.all_features(order_by=order, reverse=True)])
+
+    def test_chunked(self):
+        chunk = columnar._chunk
+        columnar._chunk = 4
+        try:
+            columnar.dump(self.db.all_features(), self.path, self.db.dialect)
+        finally:
+            columnar._chunk = chunk
+        with columnar.load(self.path) as features:
+            self.assertEqual([str(f) for f in self.db.all_features()], [str(f) for f in features])
+
+    def test_failed_dump(self):
+        def features():
+            yield from self.db.all_features()
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            columnar.dump(features(), self.path, self.db.dialect)
+        self.assertEqual(['synthetic.fmcol'], os.listdir(self.dir))
+        with columnar.load(self.path) as features:
+            self.assertEqual(num_synthetic_features, len(features))
+
+    def test_truncated(self):
+        size = os.path.getsize(self.path)
+        for length in (0, 8, size // 2, size - 1):
+            with open(self.path, 'r+b') as file:
+                file.truncate(length)
+            with self.assertRaises(ValueError):
+                columnar.load(self.path)
+
+    def test_close_with_views(self):
+        features = columnar.load(self.path)
+        start = features.start[0:3]
+        features.close()
+        self.assertEqual(3, len(start))
+
+    def test_empty(self):
+        columnar.dump([], self.path)
+        with columnar.load(self.path) as features:
+            self.assertEqual(0, len(features))
+            self.assertEqual([], list(features.all_features(order_by=('seqid', 'start'))))
+
+    def test_invalid(self):
+        path = os.path.join(self.dir, 'invalid.fmcol')
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            columnar.load(path)
+
+    def test_load_sidecar(self):
+        path = os.path.join(self.dir, 'synthetic.gff3')
+        shutil.copy(synthetic_path, path)
+        with columnar.load_sidecar(path) as features:
+            self.assertTrue(os.path.exists(columnar.sidecar_path(path)))
+            self.assertEqual(num_synthetic_features, len(features))
+            self.assertEqual(['basic1', 'different_seqid1'],
+                             [features[0]['ID'][0], features[len(features) - 1]['ID'][0]])
+        with columnar.load_sidecar(path) as features:
+            self.assertEqual(num_synthetic_features, len(features))
+
+    def test_rebuild_sidecar(self):
+        path = os.path.join(self.dir, 'synthetic.gff3')
+        shutil.copy(synthetic_path, path)
+        columnar.load_sidecar(path).close()
+        sidecar = columnar.sidecar_path(path)
+        with open(sidecar, 'r+b') as file:
+            file.truncate(os.path.getsize(sidecar) // 2)
+        with columnar.load_sidecar(path) as features:
+            self.assertEqual(num_synthetic_features, len(features))
+
+    def test_load_data(self):
+        path = os.path.join(self.dir, 'synthetic.gff3')
+        shutil.copy(synthetic_path, path)
+        for _ in range(2):
+            db = load_data([path], sidecar=True)
+            self.assertTrue(os.path.exists(columnar.sidecar_path(path)))
+            self.assertEqual(num_synthetic_features, db.count_features_of_type())
+            merged = merge_all(db)
+            self.assertEqual(1, len(merged))
+            self.assertEqual(num_synthetic_overlap, len(merged[0].children))
+
+    def test_stale_sidecar(self):
+        path = os.path.join(self.dir, 'synthetic.gff3')
+        shutil.copy(synthetic_path, path)
+        columnar.load_sidecar(path).close()
+        stat = os.stat(path)
+        with open(path, 'w') as file:
+            file.write('##gff-version 3\nseq1\tsynthetic1\tgene\t1\t10\t.\t.\t.\tID=replaced1\n')
+        # Replaced with a file that is older than the sidecar
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+        with columnar.load_sidecar(path) as features:
+            self.assertEqual(['replaced1'], [f['ID'][0] for f in features])
+
+    def test_unwritable_sidecar(self):
+        path = os.path.join(self.dir, 'synthetic.gff3')
+        shutil.copy(synthetic_path, path)
+        os.mkdir(columnar.sidecar_path(path))
+        features = columnar.load_sidecar(path)
+        self.assertNotIsInstance(features, columnar.ColumnarFeatures)
+        self.assertEqual(num_synthetic_features, len(list(features)))
+        self.assertEqual(num_synthetic_features, load_data([path], sidecar=True).count_features_of_type())
+
+    def test_invalid_dictionaries(self):
+        dictionaries = json.dumps({'byteorder': sys.byteorder}).encode()
+        with open(self.path, 'wb') as file:
+            file.write(columnar._header.pack(columnar.magic, 0, len(dictionaries)) + dictionaries + b'\0' * 64)
+        with self.assertRaises(ValueError):
+            columnar.load(self.path)
+
+    def test_score(self):
+        features = [gffutils.Feature(seqid='seq1', source='s', featuretype='peak', start=i + 1, end=i + 10,
+                                     score=score, id='peak' + str(i), dialect=self.db.dialect)
+                    for i, score in enumerate(('0.500', '1e-5', '.', '12'))]
+        columnar.dump(features, self.path, self.db.dialect)
+        with columnar.load(self.path) as loaded:
+            self.assertEqual([str(f) for f in features], [str(f) for f in loaded])
+            self.assertEqual(['.', '0.500', '12', '1e-5'], [f.score for f in loaded.all_features(order_by=('score',))])
+            with self.assertRaises(KeyError):
+                loaded.values('score')
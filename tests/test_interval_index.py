@@ -0,0 +1,121 @@
+import gffutils
+
+from feature_merge import IntervalIndex, mc
+from . import TestWithSynthDB, num_synthetic_overlap
+
+key = ('seq1', 'sequence_feature', '.')
+partition_by = ('seqid', 'featuretype', 'strand')
+
+
+class TestIntervalIndex(TestWithSynthDB):
+    def _merged(self, index, **kwargs):
+        return [f for f in index.merge(**kwargs) if f.children]
+
+    def test_overlapping(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        self.assertEqual(['no_overlap1'], [f.id for f in index.overlapping(key, 35, 35)])
+        self.assertEqual([], index.overlapping(key, 31, 34))
+        self.assertEqual([], index.overlapping(('seq3', 'sequence_feature', '.'), 1, 100))
+        self.assertEqual({'strand_plus1', 'strand_minus1'},
+                         set(f.id for f in IntervalIndex(self.db, partition_by=('seqid',)).overlapping(('seq1',), 20, 20)
+                             if f.strand != '.'))
+
+    def test_within(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        self.assertEqual([], index.within(key, 33, 33, 1))
+        self.assertEqual(['no_overlap1'], [f.id for f in index.within(key, 33, 33, 2)])
+
+    def test_defaults(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        merged = self._merged(index)
+        self.assertEqual(1, len(merged))
+        self.assertEqual(num_synthetic_overlap, len(merged[0].children))
+        self.assertEqual((1, 30), (merged[0].start, merged[0].end))
+        self.assertEqual(len(index), sum(len(c) for c in index.components()))
+
+    def test_order_independent(self):
+        features = list(self.db.all_features(order_by=('seqid', 'featuretype', 'strand', 'start')))
+        for order in (features, features[::-1], sorted(features, key=lambda f: f.end)):
+            index = IntervalIndex(self.db, order, partition_by=partition_by)
+            merged = self._merged(index)
+            self.assertEqual(1, len(merged))
+            self.assertEqual(num_synthetic_overlap, len(merged[0].children))
+
+    def test_criteria(self):
+        index = IntervalIndex(self.db)
+        merged = self._merged(index)
+        self.assertEqual(1, len(merged))
+        self.assertEqual(num_synthetic_overlap + 1, len(merged[0].children))
+        self.assertEqual('sequence_feature', merged[0].featuretype)
+
+        merged = self._merged(index, criteria=(mc.feature_type,))
+        self.assertEqual(num_synthetic_overlap, len(merged[0].children))
+
+        merged = self._merged(index, criteria=(mc.exact_coordinates_only,))
+        self.assertEqual(2, len(merged))
+
+    def test_threshold(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        merged = self._merged(index, threshold=6)
+        self.assertEqual(1, len(merged))
+        self.assertEqual(num_synthetic_overlap + 1, len(merged[0].children))
+
+    def test_cluster_at(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        self.assertEqual(['no_overlap1'], [f.id for f in index.cluster_at(key, 35)])
+        self.assertEqual([], index.cluster_at(key, 32))
+        self.assertEqual(num_synthetic_overlap, len(index.cluster_at(key, 2)))
+
+    def test_merged_at(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        self.assertIsNone(index.merged_at(key, 32))
+        self.assertFalse(index.merged_at(key, 35).children)
+        merged = index.merged_at(key, 25)
+        self.assertEqual(num_synthetic_overlap, len(merged.children))
+        self.assertEqual((1, 30), (merged.start, merged.end))
+
+    def test_cluster_at_criteria(self):
+        features = [gffutils.Feature(seqid='seq1', featuretype='gene', start=1, end=10, id='a1'),
+                    gffutils.Feature(seqid='seq1', featuretype='gene', start=5, end=20, id='a2'),
+                    gffutils.Feature(seqid='seq1', featuretype='CDS', start=8, end=12, id='b1')]
+        index = IntervalIndex(self.db, features, partition_by=('seqid',))
+        criteria = (mc.feature_type,)
+        self.assertEqual([['a1', 'a2'], ['b1']], [[f.id for f in c] for c in index.components(criteria=criteria)])
+        self.assertEqual(['a1', 'a2'], [f.id for f in index.cluster_at(('seq1',), 9, criteria=criteria)])
+        merged = index.merged_at(('seq1',), 9, criteria=criteria)
+        self.assertEqual(('gene', 1, 20), (merged.featuretype, merged.start, merged.end))
+
+    def test_merge_repeated(self):
+        index = IntervalIndex(self.db, partition_by=partition_by)
+        for _ in range(2):
+            merged = list(index.merge())
+            self.assertEqual([num_synthetic_overlap], [len(f.children) for f in merged if f.children])
+        for partition in index.partitions():
+            self.assertFalse(any(hasattr(f, 'children') for f in index.overlapping(partition, 1, 100)))
+
+        single = index.merged_at(key, 35)
+        single.start = 100
+        self.assertEqual([35], [f.start for f in index.cluster_at(key, 35)])
+
+    def test_dense(self):
+        features = [gffutils.Feature(seqid='seq1', featuretype='sequence_feature', start=i + 1, end=10000,
+                                     id='dense' + str(i)) for i in range(3000)]
+        features.append(gffutils.Feature(seqid='seq1', featuretype='sequence_feature', start=10002, end=10010,
+                                         id='separate'))
+        index = IntervalIndex(self.db, features[::-1], partition_by=('seqid',))
+        self.assertEqual([3000, 1], [len(c) for c in index.components()])
+        self.assertEqual(3000, len(index.cluster_at(('seq1',), 5000)))
+        self.assertEqual(['separate'], [f.id for f in index.cluster_at(('seq1',), 10005)])
+
+        calls = []
+
+        def counted(acc, cur, components):
+            calls.append(cur)
+            return mc.feature_type(acc, cur, components)
+
+        features = features[:300]
+        index = IntervalIndex(self.db, features, partition_by=('seqid',))
+        self.assertEqual([300], [len(c) for c in index.components(criteria=(counted,))])
+        # Criteria only run until features are connected
+        self.assertEqual(len(features) - 1, len(calls))
+        self.assertEqual(300, len(index.cluster_at(('seq1',), 150, criteria=(counted,))))